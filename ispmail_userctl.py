@@ -25,17 +25,23 @@
 
 import curses
 import curses.ascii
+import hashlib
+import io
+import math
 import os
 import re
-import struct
+import secrets
+import shutil
+import subprocess
 import sys
 from abc import ABC, abstractmethod
+from contextlib import suppress
 from dataclasses import dataclass
 from enum import Enum
-from fcntl import ioctl
-from signal import SIGWINCH, signal
-from termios import TIOCGWINSZ
-from typing import Any, Callable
+from functools import lru_cache
+from pathlib import Path
+from signal import SIGWINCH, siginterrupt, signal
+from typing import Any, Callable, Iterable
 
 ######################
 #                    #
@@ -46,6 +52,12 @@ from typing import Any, Callable
 # whether to use bcrypt passwords or sha512-crypt
 USE_BCRYPT: bool = False
 
+# socket of the local MySQL server, TCP to 127.0.0.1 is used if it is unavailable
+MYSQL_SOCKET: str = '/var/run/mysqld/mysqld.sock'
+
+# client option file with the credentials, read when running as root
+MYSQL_DEFAULTS_FILE: str = '/etc/mysql/debian.cnf'
+
 
 if not sys.stdout.isatty() or not sys.stdin.isatty():
     print('ISPMail userctl is based on curses and needs a real tty to work!')
@@ -61,6 +73,7 @@ ERR: str = '\033[31;1m[!]\033[0m'
 try:
     import MySQLdb
     from MySQLdb import connections, cursors
+    from MySQLdb.constants import CLIENT
 except ImportError:
     print(ERR + ' No MySQLdb python module found!')
     print(NOTE + '     On Debian install python3-mysqldb')
@@ -80,27 +93,29 @@ def fmt_yellow(msg: str) -> str:
     return f'\033[1;33m{msg}\033[0m'
 
 
+_QUOTA_UNITS: tuple[str, ...] = ('bytes', 'KB', 'MB', 'GB')
+
+
+# quotas repeat a lot across users, the labels are computed once per value
+@lru_cache(maxsize=256)
 def format_quota(quota: float) -> str:
-    if quota == 0:
+    if not quota:
         return 'unlimited'
 
-    if quota < 1000:
-        return f'{quota:.2f} bytes'
+    index = 0 if quota < 1000 else min(3, int(math.log10(quota) // 3))
+    return f'{quota / 1000**index:.2f} {_QUOTA_UNITS[index]}'
 
-    quota /= 1000
-    if quota < 1000:
-        return f'{quota:.2f} KB'
 
-    quota /= 1000
-    if quota < 1000:
-        return f'{quota:.2f} MB'
-
-    quota /= 1000
-    return f'{quota:.2f} GB'
+_QUOTA_RE: re.Pattern[str] = re.compile(r'([0-9.,]+)\s*(\w+)?')
+_QUOTA_QUANTIFIERS: dict[str, int] = {
+    'kb': 1000,
+    'mb': 1000 * 1000,
+    'gb': 1000 * 1000 * 1000,
+}
 
 
 def parse_quota(quota_raw: str) -> float:
-    match = re.match(r'([0-9.,]+)\s*(\w+)?', quota_raw)
+    match = _QUOTA_RE.match(quota_raw)
     if not match or not match[1]:
         msg = f"invalid quota: '{quota_raw}'"
         raise ValueError(msg)
@@ -112,15 +127,85 @@ def parse_quota(quota_raw: str) -> float:
 
     quantifier = match[2].casefold()
 
-    if quantifier == 'kb':
-        return 1000 * amount
-    if quantifier == 'mb':
-        return 1000 * 1000 * amount
-    if quantifier == 'gb':
-        return 1000 * 1000 * 1000 * amount
+    factor = _QUOTA_QUANTIFIERS.get(quantifier)
+    if factor is None:
+        msg = f"invalid quota quantifier: '{quantifier}'"
+        raise ValueError(msg)
+
+    return factor * amount
+
+
+_CRYPT_ALPHABET: str = (
+    './0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+)
+
+# byte order of the final digest encoding, see https://www.akkadia.org/drepper/SHA-crypt.txt
+_SHA512_CRYPT_ORDER: tuple[tuple[int, int, int], ...] = (
+    (0, 21, 42), (22, 43, 1), (44, 2, 23), (3, 24, 45), (25, 46, 4),
+    (47, 5, 26), (6, 27, 48), (28, 49, 7), (50, 8, 29), (9, 30, 51),
+    (31, 52, 10), (53, 11, 32), (12, 33, 54), (34, 55, 13), (56, 14, 35),
+    (15, 36, 57), (37, 58, 16), (59, 17, 38), (18, 39, 60), (40, 61, 19),
+    (62, 20, 41),
+)  # fmt: skip
+
+
+def _crypt_b64(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        chars.append(_CRYPT_ALPHABET[value & 0x3F])
+        value >>= 6
+    return ''.join(chars)
+
+
+def sha512_crypt(password: str, salt: str | None = None) -> str:
+    """sha512_crypt(password, salt) -> str
+
+    Return the SHA512-CRYPT ($6$) hash of password with the default 5000 rounds"""
+    if salt is None:
+        salt = ''.join(secrets.choice(_CRYPT_ALPHABET) for _ in range(16))
 
-    msg = f"invalid quota quantifier: '{quantifier}'"
-    raise ValueError(msg)
+    pw = password.encode('UTF-8')
+    sl = salt.encode('UTF-8')[:16]
+
+    digest_b = hashlib.sha512(pw + sl + pw).digest()
+
+    ctx = hashlib.sha512(pw + sl)
+    ctx.update(digest_b * (len(pw) // 64) + digest_b[: len(pw) % 64])
+    length = len(pw)
+    while length:
+        ctx.update(digest_b if length & 1 else pw)
+        length >>= 1
+    digest_a = ctx.digest()
+
+    digest_p = hashlib.sha512(pw * len(pw)).digest()
+    p_seq = digest_p * (len(pw) // 64) + digest_p[: len(pw) % 64]
+    s_seq = hashlib.sha512(sl * (16 + digest_a[0])).digest()[: len(sl)]
+
+    digest_c = digest_a
+    for i in range(5000):
+        ctx = hashlib.sha512(p_seq if i & 1 else digest_c)
+        if i % 3:
+            ctx.update(s_seq)
+        if i % 7:
+            ctx.update(p_seq)
+        ctx.update(digest_c if i & 1 else p_seq)
+        digest_c = ctx.digest()
+
+    encoded = ''.join(
+        _crypt_b64((digest_c[x] << 16) | (digest_c[y] << 8) | digest_c[z], 4)
+        for x, y, z in _SHA512_CRYPT_ORDER
+    )
+    encoded += _crypt_b64(digest_c[63], 2)
+
+    return f'$6${sl.decode("UTF-8")}${encoded}'
+
+
+def hash_password(password: str) -> str:
+    if USE_BCRYPT:
+        hashed_pw = bcrypt.hashpw(password.encode('UTF-8'), bcrypt.gensalt())
+        return '{BLF-CRYPT}' + hashed_pw.decode('ascii')
+
+    return '{SHA512-CRYPT}' + sha512_crypt(password)
 
 
 @dataclass
@@ -145,115 +230,324 @@ class DBAlias:
     destination: str
 
 
-DB_CURSOR: cursors.Cursor
-DB_CONNECTION: connections.Connection
+# MySQLdb has no server-side prepared statements; parameters are escaped and
+# interpolated client-side. Batched INSERTs should use executemany(), which
+# the driver rewrites into a single multi-row statement.
+#
+# All edits of a session run in one open transaction, which 'Save changes' and
+# 'Discard changes' commit or roll back as a whole. Statements must therefore
+# share this single connection instead of being spread over a pool.
+#
+# The cursor is unbuffered (SSCursor): rows are streamed from the server while
+# iterating, and every result has to be read completely before the next query.
+DB_CURSOR: cursors.SSCursor
+DB_CONNECTION: connections.Connection | None = None
+# Whether the open transaction holds changes that are neither saved nor discarded.
+DB_UNSAVED: bool = False
+
+# MySQL client error for a local server not reachable via its socket
+_CR_CONNECTION_ERROR: int = 2002
+# MySQL client errors for a connection dropped by the server or the network
+_CR_SERVER_GONE_ERROR: int = 2006
+_CR_SERVER_LOST: int = 2013
+
+
+def db_connect() -> None:
+    global DB_CURSOR
+    global DB_CONNECTION
+
+    options: dict[str, Any] = {
+        'db': 'mailserver',
+        'charset': 'utf8mb4',
+        'use_unicode': True,
+        'autocommit': False,
+        'connect_timeout': 5,
+        'read_timeout': 10,
+        'client_flag': CLIENT.MULTI_STATEMENTS,
+    }
+    if os.geteuid() == 0 and os.access(MYSQL_DEFAULTS_FILE, os.R_OK):
+        options['read_default_file'] = MYSQL_DEFAULTS_FILE
+    else:
+        options['user'] = 'root'
+        # options['password'] = ''
+
+    try:
+        DB_CONNECTION = MySQLdb.connect(
+            host='localhost',
+            unix_socket=MYSQL_SOCKET,
+            **options,
+        )
+    except MySQLdb.OperationalError as err:
+        if err.args[0] != _CR_CONNECTION_ERROR:
+            raise
+        DB_CONNECTION = MySQLdb.connect(host='127.0.0.1', **options)
+
+    ## DEBUG support
+    # import sqlite3
+    # DB_CONNECTION = sqlite3.connect("newdb.sqlite")
+
+    DB_CURSOR = DB_CONNECTION.cursor(cursors.SSCursor)
+    # the session idles while the user works in the menus, keep it for 8 hours
+    DB_CURSOR.execute('SET SESSION wait_timeout = 28800, interactive_timeout = 28800;')
+
+
+def _reconnect_if_dropped(err: MySQLdb.OperationalError) -> bool:
+    # A new connection starts a new transaction, so only reconnect if nothing
+    # unsaved would silently get lost with the old one. The cache then holds
+    # committed rows only and stays valid, as after 'Save changes'.
+    if err.args[0] not in (_CR_SERVER_GONE_ERROR, _CR_SERVER_LOST) or DB_UNSAVED:
+        return False
+
+    with suppress(MySQLdb.Error):
+        DB_CONNECTION.close()
+    db_connect()
+    return True
+
+
+def db_execute(query: str, args: tuple[Any, ...] | None = None) -> None:
+    try:
+        DB_CURSOR.execute(query, args)
+    except MySQLdb.OperationalError as err:
+        if not _reconnect_if_dropped(err):
+            raise
+        DB_CURSOR.execute(query, args)
+
+
+def db_modify(query: str, args: tuple[Any, ...] | None = None) -> None:
+    global DB_UNSAVED
+
+    db_execute(query, args)
+    DB_UNSAVED = True
+
+
+# Full-table query results, keyed by table; None means not yet fetched.
+# Every mutating db_* helper drops the entries it affects.
+_CACHE: dict[str, list[Any] | None] = {'domains': None, 'users': None, 'aliases': None}
+# Cached users and aliases grouped by domain_id, built lazily from _CACHE.
+_CACHE_BY_DOMAIN: dict[str, dict[Any, list[Any]] | None] = {
+    'users': None,
+    'aliases': None,
+}
+# Results of single-domain queries, keyed by domain_id, while _CACHE is empty.
+_CACHE_DOMAIN_QUERIES: dict[str, dict[Any, list[Any]]] = {
+    'users': {},
+    'aliases': {},
+}
+
+
+def db_invalidate(*tables: str) -> None:
+    for table in tables or _CACHE:
+        _CACHE[table] = None
+        if table in _CACHE_BY_DOMAIN:
+            _CACHE_BY_DOMAIN[table] = None
+            _CACHE_DOMAIN_QUERIES[table].clear()
+
+
+def _cached_by_domain(table: str, domain: DBDomain) -> list[Any] | None:
+    rows = _CACHE[table]
+    if rows is None:
+        queried = _CACHE_DOMAIN_QUERIES[table].get(domain.identifier)
+        return None if queried is None else list(queried)
+
+    grouped = _CACHE_BY_DOMAIN[table]
+    if grouped is None:
+        grouped = _CACHE_BY_DOMAIN[table] = {}
+        for row in rows:
+            grouped.setdefault(row.domain_id, []).append(row)
+
+    return list(grouped.get(domain.identifier, ()))
+
+
+_TABLE_QUERIES: dict[str, tuple[str, Callable[..., Any]]] = {
+    'domains': ('SELECT id, name FROM virtual_domains ORDER BY name;', DBDomain),
+    'users': (
+        'SELECT id, domain_id, email, quota FROM virtual_users ORDER BY domain_id, email;',
+        DBUser,
+    ),
+    'aliases': (
+        'SELECT id, domain_id, source, destination FROM virtual_aliases ORDER BY source, destination;',
+        DBAlias,
+    ),
+}
+
+
+def _db_load(*tables: str) -> list[list[Any]]:
+    # Fetch all tables missing from the cache in one multi-statement query.
+    missing = [table for table in tables if _CACHE[table] is None]
+    if missing:
+        db_execute(' '.join(_TABLE_QUERIES[table][0] for table in missing))
+        for index, table in enumerate(missing):
+            if index:
+                DB_CURSOR.nextset()
+            factory = _TABLE_QUERIES[table][1]
+            _CACHE[table] = [factory(*row) for row in DB_CURSOR]
+
+    return [list(_CACHE[table] or ()) for table in tables]
+
+
+# Single-domain queries, the rows omit the domain_id the caller already knows.
+_DOMAIN_QUERIES: dict[str, tuple[str, Callable[..., Any]]] = {
+    'users': (
+        'SELECT id, email, quota FROM virtual_users WHERE domain_id = %s ORDER BY email;',
+        DBUser,
+    ),
+    'aliases': (
+        'SELECT id, source, destination FROM virtual_aliases WHERE domain_id = %s ORDER BY source, destination;',
+        DBAlias,
+    ),
+}
+
+
+def _db_load_domain(domain: DBDomain, *tables: str) -> list[list[Any]]:
+    # Fetch the rows of one domain for all tables missing from the cache in
+    # one multi-statement query.
+    loaded = {table: _cached_by_domain(table, domain) for table in tables}
+    missing = [table for table, rows in loaded.items() if rows is None]
+    if missing:
+        db_execute(
+            ' '.join(_DOMAIN_QUERIES[table][0] for table in missing),
+            (domain.identifier,) * len(missing),
+        )
+        for index, table in enumerate(missing):
+            if index:
+                DB_CURSOR.nextset()
+            factory = _DOMAIN_QUERIES[table][1]
+            rows = [factory(row[0], domain.identifier, *row[1:]) for row in DB_CURSOR]
+            _CACHE_DOMAIN_QUERIES[table][domain.identifier] = rows
+            loaded[table] = list(rows)
+
+    return [loaded[table] or [] for table in tables]
 
 
 def db_get_domains() -> list[DBDomain]:
-    DB_CURSOR.execute('SELECT id, name FROM virtual_domains ORDER BY name;')
+    (domains,) = _db_load('domains')
+    return domains
 
-    return [DBDomain(row[0], row[1]) for row in DB_CURSOR.fetchall()]
+
+def db_domain_exists(name: str) -> bool:
+    # served by the UNIQUE KEY on virtual_domains.name of the ISPmail schema
+    db_execute('SELECT 1 FROM virtual_domains WHERE name = %s LIMIT 1;', (name,))
+    return bool(DB_CURSOR.fetchall())
 
 
 def db_create_domain(name: str) -> None:
-    DB_CURSOR.execute('INSERT INTO virtual_domains (name) VALUES (%s);', (name,))
+    db_modify('INSERT INTO virtual_domains (name) VALUES (%s);', (name,))
+    db_invalidate('domains')
 
 
 def db_delete_domain(domain: DBDomain) -> None:
-    DB_CURSOR.execute(
+    db_modify(
         'DELETE FROM virtual_domains where id = %s;',
         (domain.identifier,),
     )
+    # users and aliases of the domain are removed via ON DELETE CASCADE
+    db_invalidate('domains', 'users', 'aliases')
 
 
 def db_get_users(domain: DBDomain | None = None) -> list[DBUser]:
     if domain:
-        DB_CURSOR.execute(
-            'SELECT id, domain_id, email, quota FROM virtual_users WHERE domain_id = %s ORDER BY email;',
-            (domain.identifier,),
-        )
+        (users,) = _db_load_domain(domain, 'users')
     else:
-        DB_CURSOR.execute(
-            'SELECT id, domain_id, email, quota FROM virtual_users ORDER BY domain_id, email;',
-        )
+        (users,) = _db_load('users')
+    return users
+
 
-    return [DBUser(row[0], row[1], row[2], row[3]) for row in DB_CURSOR.fetchall()]
+def db_user_exists(email: str) -> bool:
+    # served by the UNIQUE KEY on virtual_users.email of the ISPmail schema
+    db_execute('SELECT 1 FROM virtual_users WHERE email = %s LIMIT 1;', (email,))
+    return bool(DB_CURSOR.fetchall())
 
 
 def db_create_user(domain: DBDomain, email: str, password: str, quota: float) -> None:
-    if USE_BCRYPT:
-        hashed_pw = bcrypt.hashpw(password.encode('UTF-8'), bcrypt.gensalt())
-        DB_CURSOR.execute(
-            'INSERT INTO virtual_users (domain_id, email, password, quota) VALUES ( %s, %s, CONCAT("{BLF-CRYPT}", %s), %s);',
-            (
-                domain.identifier,
-                email,
-                hashed_pw,
-                quota,
-            ),
-        )
-    else:
-        DB_CURSOR.execute(
-            'INSERT INTO virtual_users (domain_id, email, password, quota) VALUES ( %s, %s, CONCAT("{SHA512-CRYPT}", ENCRYPT (%s, CONCAT("$6$", SHA(RAND())))), %s);',
-            (
-                domain.identifier,
-                email,
-                password,
-                quota,
-            ),
-        )
+    db_modify(
+        'INSERT INTO virtual_users (domain_id, email, password, quota) VALUES (%s, %s, %s, %s);',
+        (
+            domain.identifier,
+            email,
+            hash_password(password),
+            quota,
+        ),
+    )
+    db_invalidate('users')
 
 
 def db_update_password(user: DBUser, password: str) -> None:
-    if USE_BCRYPT:
-        hashed_pw = bcrypt.hashpw(password.encode('UTF-8'), bcrypt.gensalt())
-        DB_CURSOR.execute(
-            'UPDATE virtual_users SET password=CONCAT("{BLF-CRYPT}", %s) WHERE id = %s;',
-            (
-                hashed_pw,
-                user.identifier,
-            ),
-        )
-    else:
-        DB_CURSOR.execute(
-            'UPDATE virtual_users SET password=CONCAT("{SHA512-CRYPT}", ENCRYPT (%s, CONCAT("$6$", SHA(RAND())))) WHERE id = %s;',
-            (
-                password,
-                user.identifier,
-            ),
-        )
+    db_modify(
+        'UPDATE virtual_users SET password=%s WHERE id = %s;',
+        (
+            hash_password(password),
+            user.identifier,
+        ),
+    )
 
 
 def db_update_quota(user: DBUser, quota: float) -> None:
-    DB_CURSOR.execute(
+    db_modify(
         'UPDATE virtual_users SET quota=%s WHERE id = %s;',
         (
             quota,
             user.identifier,
         ),
     )
+    db_invalidate('users')
 
 
 def db_delete_user(user: DBUser) -> None:
-    DB_CURSOR.execute('DELETE FROM virtual_users WHERE id = %s;', (user.identifier,))
+    db_modify('DELETE FROM virtual_users WHERE id = %s;', (user.identifier,))
+    db_invalidate('users')
 
 
 def db_get_aliases(domain: DBDomain | None = None) -> list[DBAlias]:
     if domain:
-        DB_CURSOR.execute(
-            'SELECT id, domain_id, source, destination FROM virtual_aliases WHERE domain_id = %s ORDER BY source, destination;',
-            (domain.identifier,),
-        )
+        (aliases,) = _db_load_domain(domain, 'aliases')
     else:
-        DB_CURSOR.execute(
-            'SELECT id, domain_id, source, destination FROM virtual_aliases ORDER BY source, destination;',
-        )
+        (aliases,) = _db_load('aliases')
+    return aliases
+
 
-    return [DBAlias(row[0], row[1], row[2], row[3]) for row in DB_CURSOR.fetchall()]
+def db_get_users_and_aliases(
+    domain: DBDomain | None = None,
+) -> tuple[list[DBUser], list[DBAlias]]:
+    # Both SELECTs go out in one multi-statement query to save a round-trip.
+    if domain:
+        users, aliases = _db_load_domain(domain, 'users', 'aliases')
+    else:
+        users, aliases = _db_load('users', 'aliases')
+    return users, aliases
+
+
+def db_get_all() -> tuple[list[DBDomain], list[DBUser], list[DBAlias]]:
+    domains, users, aliases = _db_load('domains', 'users', 'aliases')
+    return domains, users, aliases
+
+
+def db_search(term: str) -> tuple[list[DBDomain], list[DBUser], list[DBAlias]]:
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    pattern = f'%{escaped}%'
+    db_execute(
+        'SELECT id, name FROM virtual_domains WHERE name LIKE %s ORDER BY name;'
+        ' SELECT id, domain_id, email, quota FROM virtual_users WHERE email LIKE %s ORDER BY domain_id, email;'
+        ' SELECT id, domain_id, source, destination FROM virtual_aliases WHERE source LIKE %s OR destination LIKE %s ORDER BY source, destination;',
+        (pattern, pattern, pattern, pattern),
+    )
+    domains = [DBDomain(row[0], row[1]) for row in DB_CURSOR]
+    DB_CURSOR.nextset()
+    users = [DBUser(row[0], row[1], row[2], row[3]) for row in DB_CURSOR]
+    DB_CURSOR.nextset()
+    aliases = [DBAlias(row[0], row[1], row[2], row[3]) for row in DB_CURSOR]
+    return domains, users, aliases
+
+
+def db_alias_exists(source: str, destination: str) -> bool:
+    db_execute(
+        'SELECT 1 FROM virtual_aliases WHERE source = %s AND destination = %s LIMIT 1;',
+        (source, destination),
+    )
+    return bool(DB_CURSOR.fetchall())
 
 
 def db_create_alias(domain: DBDomain, source: str, destination: str) -> None:
-    DB_CURSOR.execute(
+    db_modify(
         'INSERT INTO virtual_aliases (domain_id, source, destination) VALUES (%s, %s, %s);',
         (
             domain.identifier,
@@ -261,10 +555,19 @@ def db_create_alias(domain: DBDomain, source: str, destination: str) -> None:
             destination,
         ),
     )
+    db_invalidate('aliases')
 
 
 def db_delete_alias(alias: DBAlias) -> None:
-    DB_CURSOR.execute('DELETE FROM virtual_aliases WHERE id = %s;', (alias.identifier,))
+    db_modify('DELETE FROM virtual_aliases WHERE id = %s;', (alias.identifier,))
+    db_invalidate('aliases')
+
+
+# Attributes of the color pairs, set up by main_app() once curses is running.
+COLOR_HEADER: int = 0
+COLOR_WORKING: int = 0
+COLOR_TEXT: int = 0
+COLOR_INPUT: int = 0
 
 
 class GuiObject(ABC):
@@ -303,12 +606,14 @@ class Note(GuiObject):
         self.full_title = f'{top_title} -> {title}' if top_title else title
         self.text = text
         self.continue_text = continue_text
+        self.dirty = True
 
     def resize(self, lines: int, cols: int) -> None:
         self.window.resize(lines, cols)
+        self.dirty = True
 
     def draw(self) -> None:
-        self.window.clear()
+        self.window.erase()
 
         self.window.addstr(1, 10, self.full_title, curses.A_BOLD)
 
@@ -322,10 +627,12 @@ class Note(GuiObject):
         self.parent.add(self)
 
         while True:
-            self.draw()
-            curses.doupdate()
+            if self.dirty:
+                self.draw()
+                curses.doupdate()
+                self.dirty = False
 
-            key = self.window.getch()
+            key = read_key(self.window)
 
             if key in [curses.KEY_ENTER, ord('\n'), ord('q'), ord('Q')]:
                 break
@@ -359,12 +666,14 @@ class Confirm(GuiObject):
         self.opta_text = opta_text
         self.optb_text = optb_text
         self.opta_active = True
+        self.dirty = True
 
     def resize(self, lines: int, cols: int) -> None:
         self.window.resize(lines, cols)
+        self.dirty = True
 
     def draw(self) -> None:
-        self.window.clear()
+        self.window.erase()
 
         self.window.addstr(1, 10, self.full_title, curses.A_BOLD)
 
@@ -385,10 +694,12 @@ class Confirm(GuiObject):
         opt_return = ConfirmResult.OPTNONE
 
         while True:
-            self.draw()
-            curses.doupdate()
+            if self.dirty:
+                self.draw()
+                curses.doupdate()
+                self.dirty = False
 
-            key = self.window.getch()
+            key = read_key(self.window)
 
             if key in [curses.KEY_ENTER, ord('\n')]:
                 if self.opta_active:
@@ -399,9 +710,11 @@ class Confirm(GuiObject):
 
             if key == curses.KEY_UP:
                 self.opta_active = True
+                self.dirty = True
 
             elif key == curses.KEY_DOWN:
                 self.opta_active = False
+                self.dirty = True
 
             elif key in [ord('q'), ord('Q')]:
                 break
@@ -418,7 +731,7 @@ class Select(GuiObject):
         screen: curses.window,
         title: str,
         top_title: str,
-        items: list[Any],
+        items: Iterable[tuple[str, Any]],
     ) -> None:
         self.window = screen.derwin(0, 0)
         self.window.keypad(True)
@@ -426,12 +739,24 @@ class Select(GuiObject):
         self.parent = parent
         self.full_title = f'{top_title} -> {title}' if top_title else title
         self.position = 0
-        self.items = items
-        self.items.append((f'Return to {top_title}', None))
+        self.items = [*items, (f'Return to {top_title}', None)]
 
         self.pad = curses.newpad(len(self.items) + 4, screen.getmaxyx()[1] - 2)
         self.pad.bkgd(screen.getbkgd())
 
+        # the pad keeps its content, later draws only move the highlight
+        self.pad.addstr(1, 10, self.full_title, curses.A_BOLD)
+        if len(self.items) > 1:
+            for index in range(len(self.items)):
+                self._draw_item(
+                    index,
+                    curses.A_REVERSE if index == self.position else curses.A_NORMAL,
+                )
+        else:
+            self.pad.addstr(3, 1, 'No entry to select')
+            self.pad.addstr(5, 1, self.items[0][0], curses.A_REVERSE)
+        self.drawn_position = self.position
+
     def _navigate(self, num: int) -> None:
         self.position += num
         if self.position < 0:
@@ -439,40 +764,43 @@ class Select(GuiObject):
         elif self.position >= len(self.items):
             self.position = len(self.items) - 1
 
+    def _draw_item(self, index: int, mode: int) -> None:
+        item = self.items[index]
+
+        # last 'return' item
+        if index == len(self.items) - 1:
+            self.pad.addstr(index + 4, 1, item[0], mode)
+        else:
+            msg = '%d. %s' % (index + 1, item[0])
+            self.pad.addstr(index + 3, 1, msg, mode)
+
     def resize(self, lines: int, cols: int) -> None:
         self.window.resize(lines, cols)
 
     def draw(self) -> None:
-        self.window.clear()
+        self.window.erase()
         self.window.noutrefresh()
-        self.pad.clear()
-        self.pad.addstr(1, 10, self.full_title, curses.A_BOLD)
 
-        if len(self.items) > 1:
-            for index, item in enumerate(self.items):
-                mode = curses.A_REVERSE if index == self.position else curses.A_NORMAL
+        if self.drawn_position != self.position:
+            self._draw_item(self.drawn_position, curses.A_NORMAL)
+            self._draw_item(self.position, curses.A_REVERSE)
+            self.drawn_position = self.position
 
-                # last 'return' item
-                if index == len(self.items) - 1:
-                    self.pad.addstr(index + 4, 1, item[0], mode)
-                else:
-                    msg = '%d. %s' % (index + 1, item[0])
-                    self.pad.addstr(index + 3, 1, msg, mode)
-        else:
-            self.pad.addstr(3, 1, 'No entry to select')
-            self.pad.addstr(5, 1, self.items[0][0], curses.A_REVERSE)
+        begin_y, begin_x = self.window.getbegyx()
+        max_y, max_x = self.window.getmaxyx()
+        num_items = len(self.items)
 
         padpos = self.position
-        if (self.window.getmaxyx()[0] - 5) > len(self.items) - padpos:
-            padpos -= (self.window.getmaxyx()[0] - 5) - (len(self.items) - padpos)
+        if (max_y - 5) > num_items - padpos:
+            padpos -= (max_y - 5) - (num_items - padpos)
 
-        self.pad.refresh(
+        self.pad.noutrefresh(
             padpos,
             0,
-            self.window.getbegyx()[0],
-            self.window.getbegyx()[1],
-            self.window.getbegyx()[0] + self.window.getmaxyx()[0] - 1,
-            self.window.getbegyx()[1] + self.window.getmaxyx()[1] - 1,
+            begin_y,
+            begin_x,
+            begin_y + max_y - 1,
+            begin_x + max_x - 1,
         )
 
     def run(self) -> Any:
@@ -484,7 +812,7 @@ class Select(GuiObject):
             self.draw()
             curses.doupdate()
 
-            key = self.window.getch()
+            key = read_key(self.window)
 
             if key in [curses.KEY_ENTER, ord('\n')]:
                 if self.position != len(self.items) - 1:
@@ -528,10 +856,12 @@ class SingleInput(GuiObject):
         self.text_lines = len(self.text) - 1
         self.input_visible = input_visible
         self.input_string = ''
+        # what is shown for input_string, masked for invisible input
+        self.display_string = ''
         self.input_active = True
 
         self.pad = curses.newpad(1, screen.getmaxyx()[1] - 2)
-        self.pad.bkgd(curses.color_pair(4))
+        self.pad.bkgd(COLOR_INPUT)
         self.input_size = self.window.getmaxyx()[1] - 9
 
     def resize(self, lines: int, cols: int) -> None:
@@ -539,7 +869,7 @@ class SingleInput(GuiObject):
         self.input_size = self.window.getmaxyx()[1] - 9
 
     def draw(self) -> None:
-        self.window.clear()
+        self.window.erase()
 
         self.window.addstr(1, 10, self.full_title, curses.A_BOLD)
 
@@ -555,22 +885,23 @@ class SingleInput(GuiObject):
 
         self.window.noutrefresh()
 
-        self.pad.clear()
+        self.pad.erase()
 
-        txt = self.input_string if self.input_visible else '*' * len(self.input_string)
+        txt = self.display_string
         if len(txt) >= self.input_size - 1:
             txt = txt[-(self.input_size - 1) :]
 
-        self.pad.addstr(0, 0, '> ', curses.color_pair(2))
-        self.pad.addstr(0, 2, txt, curses.color_pair(3))
+        self.pad.addstr(0, 0, '> ', COLOR_WORKING)
+        self.pad.addstr(0, 2, txt, COLOR_TEXT)
 
-        self.pad.refresh(
+        begin_y, begin_x = self.window.getbegyx()
+        self.pad.noutrefresh(
             0,
             0,
-            self.window.getbegyx()[0] + 5 + self.text_lines,
-            self.window.getbegyx()[1] + 4,
-            self.window.getbegyx()[0] + 5 + self.text_lines + 1,
-            self.window.getbegyx()[1] + self.window.getmaxyx()[1] - 4,
+            begin_y + 5 + self.text_lines,
+            begin_x + 4,
+            begin_y + 5 + self.text_lines + 1,
+            begin_x + self.window.getmaxyx()[1] - 4,
         )
 
     def run(self) -> None | str:
@@ -584,7 +915,7 @@ class SingleInput(GuiObject):
                 curses.curs_set(1)
             self.pad.move(0, min(2 + len(self.input_string), self.input_size))
             self.pad.clrtoeol()
-            key = self.window.getch()
+            key = read_key(self.window)
             curses.curs_set(0)
 
             if key in [curses.KEY_ENTER, ord('\n')]:
@@ -598,6 +929,7 @@ class SingleInput(GuiObject):
 
             elif self.input_active and curses.ascii.isgraph(key):
                 self.input_string += chr(key)
+                self.display_string += chr(key) if self.input_visible else '*'
 
             elif (
                 self.input_active
@@ -605,6 +937,7 @@ class SingleInput(GuiObject):
                 and self.input_string
             ):
                 self.input_string = self.input_string[:-1]
+                self.display_string = self.display_string[:-1]
 
         self.parent.remove(self)
 
@@ -637,26 +970,30 @@ class Info(GuiObject):
         self.pos += num
         if self.pos < 0:
             self.pos = 0
-        if self.pos > self.size - self.window.getmaxyx()[0] + 4:
-            self.pos = self.size - self.window.getmaxyx()[0] + 4
+        max_pos = self.size - self.window.getmaxyx()[0] + 4
+        if self.pos > max_pos:
+            self.pos = max_pos
 
     def resize(self, lines: int, cols: int) -> None:
         self.window.resize(lines, cols)
 
     def draw(self) -> None:
-        self.window.clear()
+        self.window.erase()
         self.window.noutrefresh()
-        self.pad.clear()
+        self.pad.erase()
         self.pad.addstr(0, 9, self.full_title, curses.A_BOLD)
         self.pad.addstr(2, 0, self.info)
         self.pad.addstr(f'\n\nReturn to {self.top_title}', curses.A_REVERSE)
-        self.pad.refresh(
+
+        begin_y, begin_x = self.window.getbegyx()
+        max_y, max_x = self.window.getmaxyx()
+        self.pad.noutrefresh(
             self.pos,
             0,
-            self.window.getbegyx()[0] + 1,
-            self.window.getbegyx()[1] + 1,
-            self.window.getbegyx()[0] + self.window.getmaxyx()[0] - 3,
-            self.window.getbegyx()[1] + self.window.getmaxyx()[1] - 3,
+            begin_y + 1,
+            begin_x + 1,
+            begin_y + max_y - 3,
+            begin_x + max_x - 3,
         )
         self.size = self.pad.getyx()[0]
 
@@ -667,7 +1004,7 @@ class Info(GuiObject):
             self.draw()
             curses.doupdate()
 
-            key = self.window.getch()
+            key = read_key(self.window)
 
             if key in [curses.KEY_ENTER, ord('\n'), ord('q'), ord('Q')]:
                 break
@@ -709,7 +1046,11 @@ class Menu(GuiManager):
         self.full_title = f'{top_title} -> {title}' if top_title else title
         self.screen = screen
         self.args = args
-        self.children: set[GuiObject] = set()
+        self.children: list[GuiObject] = []
+        # children paint over the menu, so it needs a full redraw after one
+        # is removed or the screen got resized
+        self.full_redraw = True
+        self.drawn_position = self.position
 
     def _navigate(self, num: int) -> None:
         self.position += num
@@ -718,28 +1059,40 @@ class Menu(GuiManager):
         elif self.position >= len(self.items):
             self.position = len(self.items) - 1
 
+    def _draw_item(self, index: int, mode: int) -> None:
+        msg = '%d. %s' % (index + 1, self.items[index][0])
+        self.window.addstr(index + 3, 1, msg, mode)
+
     def add(self, child: GuiObject) -> None:
-        self.children.add(child)
+        self.children.append(child)
 
     def remove(self, child: GuiObject) -> None:
         self.children.remove(child)
+        self.full_redraw = True
 
     def resize(self, lines: int, cols: int) -> None:
         self.window.resize(lines, cols)
+        self.full_redraw = True
 
         for child in self.children:
             child.resize(lines, cols)
 
     def draw(self) -> None:
-        self.window.clear()
+        if self.full_redraw:
+            self.window.erase()
 
-        self.window.addstr(1, 10, self.full_title, curses.A_BOLD)
+            self.window.addstr(1, 10, self.full_title, curses.A_BOLD)
 
-        for index, item in enumerate(self.items):
-            mode = curses.A_REVERSE if index == self.position else curses.A_NORMAL
+            for index in range(len(self.items)):
+                mode = curses.A_REVERSE if index == self.position else curses.A_NORMAL
+                self._draw_item(index, mode)
 
-            msg = '%d. %s' % (index + 1, item[0])
-            self.window.addstr(index + 3, 1, msg, mode)
+            self.full_redraw = False
+        elif self.drawn_position != self.position:
+            self._draw_item(self.drawn_position, curses.A_NORMAL)
+            self._draw_item(self.position, curses.A_REVERSE)
+
+        self.drawn_position = self.position
 
         self.window.noutrefresh()
 
@@ -753,7 +1106,7 @@ class Menu(GuiManager):
             self.draw()
             curses.doupdate()
 
-            key = self.window.getch()
+            key = read_key(self.window)
 
             if key in [curses.KEY_ENTER, ord('\n')]:
                 if self.position == len(self.items) - 1:
@@ -767,8 +1120,10 @@ class Menu(GuiManager):
                 if do_exit:
                     break
 
-            elif key in map(ord, map(str, range(1, len(self.items) + 1))):
-                idx = int(chr(key)) - 1
+            elif ord('1') <= key <= ord('9'):
+                idx = key - ord('1')
+                if idx >= len(self.items):
+                    continue
                 if idx == len(self.items) - 1:
                     break
                 do_exit = self.items[idx][1](
@@ -792,17 +1147,52 @@ class Menu(GuiManager):
         self.parent.remove(self)
 
 
+WriteFunc = Callable[[str], int]
+
+
+def write_domains(write: WriteFunc, domains: list[DBDomain]) -> None:
+    for domain in domains:
+        write(f'\t{domain.name}\n')
+
+
+def write_users(write: WriteFunc, users: list[DBUser]) -> None:
+    for user in users:
+        write(f'\t{user.email}  --  {format_quota(user.quota)} quota\n')
+
+
+def write_aliases(
+    write: WriteFunc,
+    aliases: list[DBAlias],
+    user_emails: set[str],
+) -> None:
+    prev_source = None
+    for alias in aliases:
+        foreign_msg = (
+            '  (internal destination email)'
+            if alias.destination in user_emails
+            else '  (foreign destination email)'
+        )
+
+        if prev_source == alias.source:
+            write(f'\t  -> {alias.destination}{foreign_msg}\n')
+        else:
+            write(f'\t{alias.source}\n\t  -> {alias.destination}{foreign_msg}\n')
+
+        prev_source = alias.source
+
+
 def domain_overview_win(
     parent: GuiManager,
     window: curses.window,
     top_title: str,
 ) -> None:
     domains = db_get_domains()
-    text = 'Found %d domain(s):\n\n' % len(domains)
-    for domain in domains:
-        text += f'\t{domain.name}\n'
+    buf = io.StringIO()
+    write = buf.write
+    write('Found %d domain(s):\n\n' % len(domains))
+    write_domains(write, domains)
 
-    handle = Info(parent, window, 'Domain Overview', top_title, text)
+    handle = Info(parent, window, 'Domain Overview', top_title, buf.getvalue())
     handle.run()
 
 
@@ -811,34 +1201,20 @@ def full_overview_win(
     window: curses.window,
     top_title: str,
 ) -> None:
-    domains = db_get_domains()
-    users = db_get_users()
-    aliases = db_get_aliases()
-    text = 'Found %d domain(s):\n\n' % len(domains)
-    for domain in domains:
-        text += f'\t{domain.name}\n'
-    text += '\nFound %d user(s):\n\n' % len(users)
-    for user in users:
-        text += f'\t{user.email}  --  {format_quota(user.quota)} quota\n'
-    text += '\nFound %d alias(es):\n\n' % len(aliases)
-    aliases.sort(key=lambda alias: alias.source)
-    prev_source = None
-    for alias in aliases:
-        if any(alias.destination == user.email for user in users):
-            foreign_msg = '  (internal destination email)'
-        else:
-            foreign_msg = '  (foreign destination email)'
-
-        if prev_source == alias.source:
-            text += f'\t  -> {alias.destination}{foreign_msg}\n'
-        else:
-            text += f'\t{alias.source}\n\t  -> {alias.destination}{foreign_msg}\n'
-
-        prev_source = alias.source
-
-    handle = Info(parent, window, 'Full Overview', top_title, text)
+    domains, users, aliases = db_get_all()
+    buf = io.StringIO()
+    write = buf.write
+    write('Found %d domain(s):\n\n' % len(domains))
+    write_domains(write, domains)
+    write('\nFound %d user(s):\n\n' % len(users))
+    write_users(write, users)
+    write('\nFound %d alias(es):\n\n' % len(aliases))
+    write_aliases(write, aliases, {user.email for user in users})
+
+    handle = Info(parent, window, 'Full Overview', top_title, buf.getvalue())
     handle.run()
 
+
 def search_win(parent: GuiManager, window: curses.window, top_title: str) -> None:
     handle0 = SingleInput(
         parent,
@@ -852,43 +1228,24 @@ def search_win(parent: GuiManager, window: curses.window, top_title: str) -> Non
     if not search_term:
         return
 
-    domains = db_get_domains()
-    users = db_get_users()
-    aliases = db_get_aliases()
-    text = 'Search results for term "%s":\n\n' % search_term
-
-    domains = [domain for domain in domains if search_term in domain.name]
-    users = [user for user in users if search_term in user.email]
-    aliases = [alias for alias in aliases if search_term in alias.source or search_term in alias.destination]
+    domains, users, aliases = db_search(search_term)
+    buf = io.StringIO()
+    write = buf.write
+    write('Search results for term "%s":\n\n' % search_term)
 
     if domains:
-        text += 'Found %d domain(s):\n\n' % len(domains)
-        for domain in domains:
-            text += f'\t{domain.name}\n'
+        write('Found %d domain(s):\n\n' % len(domains))
+        write_domains(write, domains)
 
     if users:
-        text += '\nFound %d user(s):\n\n' % len(users)
-        for user in users:
-            text += f'\t{user.email}  --  {format_quota(user.quota)} quota\n'
+        write('\nFound %d user(s):\n\n' % len(users))
+        write_users(write, users)
 
     if aliases:
-        text += '\nFound %d alias(es):\n\n' % len(aliases)
-        aliases.sort(key=lambda alias: alias.source)
-        prev_source = None
-        for alias in aliases:
-            if any(alias.destination == user.email for user in users):
-                foreign_msg = '  (internal destination email)'
-            else:
-                foreign_msg = '  (foreign destination email)'
-
-            if prev_source == alias.source:
-                text += f'\t  -> {alias.destination}{foreign_msg}\n'
-            else:
-                text += f'\t{alias.source}\n\t  -> {alias.destination}{foreign_msg}\n'
-
-            prev_source = alias.source
-
-    handle1 = Info(parent, window, 'Search Results', top_title, text)
+        write('\nFound %d alias(es):\n\n' % len(aliases))
+        write_aliases(write, aliases, {user.email for user in users})
+
+    handle1 = Info(parent, window, 'Search Results', top_title, buf.getvalue())
     handle1.run()
 
 
@@ -903,7 +1260,7 @@ def domain_add_win(parent: GuiManager, window: curses.window, top_title: str) ->
     )
     domain_name = handle0.run()
     if domain_name:
-        if domain_name in [domain.name for domain in db_get_domains()]:
+        if db_domain_exists(domain_name):
             handle1 = Note(
                 parent,
                 window,
@@ -934,7 +1291,7 @@ def domain_selection_win(
         window,
         'Select Domain to manage',
         top_title,
-        [(domain.name, domain) for domain in db_get_domains()],
+        ((domain.name, domain) for domain in db_get_domains()),
     )
     domain = handle0.run()
     if not domain:
@@ -967,26 +1324,15 @@ def domain_list_usersaliases_win(
     top_title: str,
     domain: DBDomain,
 ) -> None:
-    users = db_get_users(domain)
-    aliases = db_get_aliases(domain)
-    text = '\nFound %d user(s):\n\n' % len(users)
-    for user in users:
-        text += f'\t{user.email}  --  {format_quota(user.quota)} quota\n'
-    text += '\nFound %d alias(es):\n\n' % len(aliases)
-    aliases.sort(key=lambda alias: alias.source)
-    prev_source = None
-    for alias in aliases:
-        if any(alias.destination == user.email for user in users):
-            foreign_msg = '  (internal destination email)'
-        else:
-            foreign_msg = '  (foreign destination email)'
+    users, aliases = db_get_users_and_aliases(domain)
+    buf = io.StringIO()
+    write = buf.write
+    write('\nFound %d user(s):\n\n' % len(users))
+    write_users(write, users)
+    write('\nFound %d alias(es):\n\n' % len(aliases))
+    write_aliases(write, aliases, {user.email for user in users})
 
-        if prev_source == alias.source:
-            text += f'\t  -> {alias.destination}{foreign_msg}\n'
-        else:
-            text += f'\t{alias.source}\n\t  -> {alias.destination}{foreign_msg}\n'
-
-        prev_source = alias.source
+    text = buf.getvalue()
 
     handle = Info(parent, window, 'List of users and aliases', top_title, text)
     handle.run()
@@ -1003,7 +1349,7 @@ def domain_delete_user_win(
         window,
         'Select user to delete',
         top_title,
-        [(user.email, user) for user in db_get_users(domain)],
+        ((user.email, user) for user in db_get_users(domain)),
     )
     user = handle0.run()
     if not user:
@@ -1034,13 +1380,13 @@ def domain_delete_alias_win(
         window,
         'Select alias to delete',
         top_title,
-        [
+        (
             (
                 f'{alias.source}  ->  {alias.destination}',
                 alias,
             )
             for alias in db_get_aliases(domain)
-        ],
+        ),
     )
     alias = handle0.run()
     if not alias:
@@ -1071,7 +1417,7 @@ def domain_change_pw_win(
         window,
         'Select user for password change',
         top_title,
-        [(user.email, user) for user in db_get_users(domain)],
+        ((user.email, user) for user in db_get_users(domain)),
     )
     user = handle0.run()
     if not user:
@@ -1128,7 +1474,10 @@ def domain_change_quota_win(
         window,
         'Select user for quota change',
         top_title,
-        [(user.email, user) for user in db_get_users(domain)],
+        (
+            (f'{user.email}  [{format_quota(user.quota)}]', user)
+            for user in db_get_users(domain)
+        ),
     )
     user = handle0.run()
     if not user:
@@ -1196,7 +1545,7 @@ def domain_add_user_win(
         handle1.run()
         return
 
-    if user_name + '@' + domain.name in [user.email for user in db_get_users(domain)]:
+    if db_user_exists(f'{user_name}@{domain.name}'):
         handle2 = Note(
             parent,
             window,
@@ -1319,10 +1668,7 @@ def domain_add_alias_win(
         handle3.run()
         return
 
-    if any(
-        alias.source == source + '@' + domain.name and alias.destination == destination
-        for alias in db_get_aliases(domain)
-    ):
+    if db_alias_exists(f'{source}@{domain.name}', destination):
         handle4 = Note(
             parent,
             window,
@@ -1373,6 +1719,8 @@ def discard_changes_win(
     window: curses.window,
     top_title: str,
 ) -> None:
+    global DB_UNSAVED
+
     handle = Confirm(
         parent,
         window,
@@ -1384,9 +1732,13 @@ def discard_changes_win(
     )
     if handle.run() == ConfirmResult.OPTB:
         DB_CONNECTION.rollback()
+        DB_UNSAVED = False
+        db_invalidate()
 
 
 def save_changes_win(parent: GuiManager, window: curses.window, top_title: str) -> None:
+    global DB_UNSAVED
+
     handle = Confirm(
         parent,
         window,
@@ -1398,42 +1750,98 @@ def save_changes_win(parent: GuiManager, window: curses.window, top_title: str)
     )
     if handle.run() == ConfirmResult.OPTB:
         DB_CONNECTION.commit()
+        DB_UNSAVED = False
+        # the next read starts a new snapshot, drop what other clients may have changed
+        db_invalidate()
+
+
+# Parsed REJECT entries of the access file, None means not yet read.
+_BLOCKED_ENTRIES: set[str] | None = None
+# Whether the access file changed since the last postmap run.
+_ACCESS_DIRTY: bool = False
+# The REJECT action following the address of an access line, shared by the
+# parser and remove_blocked_entry() so both agree on which lines are entries.
+_REJECT_ACTION: str = r'[ \t]+REJECT(?=\s|$)'
+# Address of every non-comment access line whose action is REJECT.
+_REJECT_RE: re.Pattern[str] = re.compile(
+    rf'^[ \t]*([^\s#]\S*){_REJECT_ACTION}',
+    re.MULTILINE,
+)
+
+
+def _blocked_entries() -> set[str]:
+    global _BLOCKED_ENTRIES
+
+    if _BLOCKED_ENTRIES is None:
+        try:
+            with open('/etc/postfix/access', 'r') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = ''
+        _BLOCKED_ENTRIES = set(_REJECT_RE.findall(data))
+    return _BLOCKED_ENTRIES
+
 
 def read_blocked_entries() -> list[str]:
-    entries = []
-    try:
-        with open('/etc/postfix/access', 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    parts = line.split()
-                    if len(parts) >= 2 and parts[1] == 'REJECT':
-                        entries.append(parts[0])
-    except FileNotFoundError:
-        pass
-    return entries
+    return sorted(_blocked_entries())
+
+
+def is_blocked(address: str) -> bool:
+    return address in _blocked_entries()
+
+
+def reload_postmap() -> None:
+    # capture the output, it would otherwise end up on the curses screen
+    subprocess.run(
+        ['/usr/sbin/postmap', 'hash:/etc/postfix/access'],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+
+def flush_blocked_entries() -> None:
+    global _ACCESS_DIRTY
+
+    if _ACCESS_DIRTY:
+        reload_postmap()
+        _ACCESS_DIRTY = False
+
 
 def add_blocked_entry(address: str) -> None:
+    global _ACCESS_DIRTY
+
     with open('/etc/postfix/access', 'a') as f:
         f.write(f"{address} REJECT\n")
-    os.system("postmap hash:/etc/postfix/access")
+    if _BLOCKED_ENTRIES is not None:
+        _BLOCKED_ENTRIES.add(address)
+    _ACCESS_DIRTY = True
+
 
 def remove_blocked_entry(address: str) -> None:
-    lines = []
+    global _ACCESS_DIRTY
+
+    path = Path('/etc/postfix/access')
     try:
-        with open('/etc/postfix/access', 'r') as f:
-            for line in f:
-                stripped = line.strip()
-                if stripped and not stripped.startswith('#'):
-                    parts = stripped.split()
-                    if len(parts) >= 2 and parts[1] == 'REJECT' and parts[0] == address:
-                        continue
-                lines.append(line)
+        data = path.read_text()
     except FileNotFoundError:
         return
-    with open('/etc/postfix/access', 'w') as f:
-        f.writelines(lines)
-    os.system("postmap hash:/etc/postfix/access")
+
+    entry_re = re.compile(rf'[ \t]*{re.escape(address)}{_REJECT_ACTION}')
+    content = ''.join(
+        line for line in data.splitlines(keepends=True) if not entry_re.match(line)
+    )
+
+    # write a copy and rename it over the original, so postfix never sees a
+    # partially written file
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.write_text(content)
+    shutil.copymode(path, tmp_path)
+    tmp_path.replace(path)
+    if _BLOCKED_ENTRIES is not None:
+        _BLOCKED_ENTRIES.discard(address)
+    _ACCESS_DIRTY = True
+
 
 def manage_blocked_emails_win(
     parent: GuiManager,
@@ -1453,7 +1861,29 @@ def manage_blocked_emails_win(
         top_title,
         menu_items,
     )
-    handle.run()
+
+    # rebuild the postfix lookup table once for all edits done in the menu
+    postmap_error = None
+    try:
+        handle.run()
+    finally:
+        try:
+            flush_blocked_entries()
+        except subprocess.CalledProcessError as err:
+            postmap_error = err.stderr.strip() or str(err)
+        except OSError as err:
+            postmap_error = str(err)
+
+    if postmap_error:
+        handle1 = Note(
+            parent,
+            window,
+            'Update Blocked Entries Failed',
+            top_title,
+            f'Could not rebuild the postfix access table: {postmap_error}',
+        )
+        handle1.run()
+
 
 def list_blocked_entries_win(
     parent: GuiManager,
@@ -1461,15 +1891,15 @@ def list_blocked_entries_win(
     top_title: str,
 ) -> None:
     entries = read_blocked_entries()
-    text = 'Blocked email addresses/patterns:\n\n'
     if entries:
-        for entry in entries:
-            text += f'\t{entry}\n'
+        body = '\n'.join(f'\t{entry}' for entry in entries)
     else:
-        text += '\tNo blocked entries found.\n'
+        body = '\tNo blocked entries found.'
+    text = f'Blocked email addresses/patterns:\n\n{body}\n'
     handle = Info(parent, window, 'Blocked Entries', top_title, text)
     handle.run()
 
+
 def add_blocked_entry_win(
     parent: GuiManager,
     window: curses.window,
@@ -1485,8 +1915,7 @@ def add_blocked_entry_win(
     )
     address = handle0.run()
     if address:
-        entries = read_blocked_entries()
-        if address in entries:
+        if is_blocked(address):
             handle1 = Note(
                 parent,
                 window,
@@ -1496,7 +1925,19 @@ def add_blocked_entry_win(
             )
             handle1.run()
         else:
-            add_blocked_entry(address)
+            try:
+                add_blocked_entry(address)
+            except OSError as err:
+                handle1 = Note(
+                    parent,
+                    window,
+                    'Add Blocked Entry Failed',
+                    top_title,
+                    f"Could not block entry '{address}': {err}",
+                )
+                handle1.run()
+                return
+
             handle1 = Note(
                 parent,
                 window,
@@ -1506,6 +1947,7 @@ def add_blocked_entry_win(
             )
             handle1.run()
 
+
 def remove_blocked_entry_win(
     parent: GuiManager,
     window: curses.window,
@@ -1528,7 +1970,7 @@ def remove_blocked_entry_win(
         window,
         'Select Entry to Unblock',
         top_title,
-        [(entry, entry) for entry in entries],
+        ((entry, entry) for entry in entries),
     )
     selected_entry = handle0.run()
     if selected_entry:
@@ -1543,7 +1985,19 @@ def remove_blocked_entry_win(
         )
         result = handle1.run()
         if result == ConfirmResult.OPTB:
-            remove_blocked_entry(selected_entry)
+            try:
+                remove_blocked_entry(selected_entry)
+            except OSError as err:
+                handle2 = Note(
+                    parent,
+                    window,
+                    'Unblock Entry Failed',
+                    top_title,
+                    f"Could not unblock entry '{selected_entry}': {err}",
+                )
+                handle2.run()
+                return
+
             handle2 = Note(
                 parent,
                 window,
@@ -1554,19 +2008,13 @@ def remove_blocked_entry_win(
             handle2.run()
 
 
-
-# From https://groups.google.com/forum/#!msg/comp.lang.python/CpUszNNXUQM/QADpl11Z-nAJ
 def getheightwidth() -> tuple[int, int]:
-    """getwidth() -> (int, int)
+    """getheightwidth() -> (int, int)
 
     Return the height and width of the console in characters"""
-    try:
-        return int(os.environ['LINES']), int(os.environ['COLUMNS'])
-    except KeyError:
-        height, width = struct.unpack('hhhh', ioctl(0, TIOCGWINSZ, '\000' * 8))[0:2]  # type: ignore
-        if not height:
-            return 25, 80
-        return height, width
+    # honours LINES and COLUMNS before asking the terminal
+    size = shutil.get_terminal_size(fallback=(80, 25))
+    return size.lines, size.columns
 
 
 class MainApp(GuiManager):
@@ -1584,14 +2032,16 @@ class MainApp(GuiManager):
             self.header_size,
             self.main_margin,
         )
-        self.working_win.bkgd(curses.color_pair(2))
+        self.working_win.bkgd(COLOR_WORKING)
         self.footer_win = screen.derwin(
             self.footer_size,
             cols,
             lines - self.footer_size,
             0,
         )
-        self.children: set[GuiObject] = set()
+        self.header_y = self.header_size // 2
+        self.header_x = cols // 2 - len(self.header_text) // 2
+        self.children: list[GuiObject] = []
 
         main_menu_items: MenuItemType = [
             ('List domains', domain_overview_win),
@@ -1606,7 +2056,7 @@ class MainApp(GuiManager):
         self.main_menu = Menu(self, self.working_win, 'Overview', None, main_menu_items)
 
     def add(self, child: GuiObject) -> None:
-        self.children.add(child)
+        self.children.append(child)
 
     def remove(self, child: GuiObject) -> None:
         self.children.remove(child)
@@ -1614,6 +2064,7 @@ class MainApp(GuiManager):
     def resize(self, lines: int, cols: int) -> None:
         self.header_win.resize(self.header_size, cols)
         self.header_win.mvwin(0, 0)
+        self.header_x = cols // 2 - len(self.header_text) // 2
 
         self.working_win.resize(
             lines - self.header_size - self.footer_size,
@@ -1631,20 +2082,20 @@ class MainApp(GuiManager):
             )
 
     def draw(self) -> None:
+        # Only runs on start and after a resize, widgets redraw themselves on
+        # input. The working area is covered by the children, which paint
+        # their own windows.
         self.header_win.clear()
 
         self.header_win.addstr(
-            int(self.header_size / 2),
-            int(self.header_win.getmaxyx()[1] / 2) - int(len(self.header_text) / 2),
+            self.header_y,
+            self.header_x,
             self.header_text,
-            curses.color_pair(1) | curses.A_BOLD,
+            COLOR_HEADER,
         )
 
         self.header_win.noutrefresh()
 
-        self.working_win.clear()
-        self.working_win.noutrefresh()
-
         self.footer_win.clear()
         self.footer_win.addstr(0, 7, 'Usage: (q) to return/quit, UP/DOWN to navigate')
         self.footer_win.noutrefresh()
@@ -1652,6 +2103,11 @@ class MainApp(GuiManager):
         for child in self.children:
             child.draw()
 
+        # children only stage their windows, push everything in one go; the
+        # windows are tiled derwin()s sharing the screen, so they need no
+        # curses.panel stacking
+        curses.doupdate()
+
     def run(self) -> None:
         self.draw()
         self.main_menu.run()
@@ -1660,12 +2116,33 @@ class MainApp(GuiManager):
 MAINAPP: MainApp
 
 
+# Set by the SIGWINCH handler, the resize is applied by read_key().
+RESIZE_PENDING: bool = False
+
+
 def resize_handler(signum: int, _: Any) -> None:
+    global RESIZE_PENDING
+
     del signum
-    lines, cols = getheightwidth()
-    curses.resizeterm(lines, cols)
-    MAINAPP.resize(lines, cols)
-    MAINAPP.draw()
+    # a drag sends a burst of signals, only flag them and resize once
+    RESIZE_PENDING = True
+
+
+def read_key(window: curses.window) -> int:
+    global RESIZE_PENDING
+
+    while True:
+        if RESIZE_PENDING:
+            RESIZE_PENDING = False
+            lines, cols = getheightwidth()
+            curses.resizeterm(lines, cols)
+            MAINAPP.resize(lines, cols)
+            MAINAPP.draw()
+
+        key = window.getch()
+        # getch() is interrupted by SIGWINCH and then returns no key
+        if key not in (curses.ERR, curses.KEY_RESIZE):
+            return key
 
 
 def main_app(screen: curses.window) -> None:
@@ -1677,14 +2154,39 @@ def main_app(screen: curses.window) -> None:
     curses.init_pair(3, curses.COLOR_BLACK, curses.COLOR_GREEN)
     curses.init_pair(4, curses.COLOR_BLACK, curses.COLOR_WHITE)
 
+    global COLOR_HEADER, COLOR_WORKING, COLOR_TEXT, COLOR_INPUT
+    COLOR_HEADER = curses.color_pair(1) | curses.A_BOLD
+    COLOR_WORKING = curses.color_pair(2)
+    COLOR_TEXT = curses.color_pair(3)
+    COLOR_INPUT = curses.color_pair(4)
+
     global MAINAPP
     MAINAPP = MainApp(screen)
 
+    # All widgets block in getch() without nodelay()/timeout(), so the UI is
+    # idle while waiting for input; resizes interrupt it and are redrawn there.
     signal(SIGWINCH, resize_handler)
+    siginterrupt(SIGWINCH, True)
 
     MAINAPP.run()
 
 
+def _shutdown(commit: bool) -> None:
+    # connecting failed, there is nothing to close
+    if DB_CONNECTION is None:
+        return
+
+    if commit:
+        DB_CONNECTION.commit()
+        DB_CONNECTION.close()
+        return
+
+    # closing discards the open transaction on the server, no rollback needed;
+    # the connection may already be broken, which must not hide the real error
+    with suppress(MySQLdb.Error):
+        DB_CONNECTION.close()
+
+
 def main() -> None:
     print(NOTE + ' # ISPMail userctl')
 
@@ -1701,42 +2203,19 @@ def main() -> None:
         print(WARN + '   recommend minimum is (25 x 80)')
         print(WARN + '   app might be unstable')
 
-    global DB_CURSOR
-    global DB_CONNECTION
-
     try:
-        DB_CONNECTION = MySQLdb.connect(
-            host='localhost',
-            user='root',
-            # password='',
-            db='mailserver',
-            charset='utf8mb4',
-        )
-
-        ## DEBUG support
-        # import sqlite3
-        # DB_CONNECTION = sqlite3.connect("newdb.sqlite")
-
-        DB_CURSOR = DB_CONNECTION.cursor()
+        db_connect()
 
         curses.wrapper(main_app)
 
     except KeyboardInterrupt:
-        if DB_CURSOR:
-            DB_CURSOR.close()
-        if DB_CONNECTION:
-            DB_CONNECTION.rollback()
-            DB_CONNECTION.close()
+        _shutdown(commit=False)
 
         print(WARN + fmt_yellow(' Unsaved changes are lost!'))
         sys.exit(1)
 
     except MySQLdb.Error as err:
-        if DB_CURSOR:
-            DB_CURSOR.close()
-        if DB_CONNECTION:
-            DB_CONNECTION.rollback()
-            DB_CONNECTION.close()
+        _shutdown(commit=False)
 
         print(
             ERR
@@ -1750,19 +2229,13 @@ def main() -> None:
         raise
 
     except:
-        if DB_CURSOR:
-            DB_CURSOR.close()
-        if DB_CONNECTION:
-            DB_CONNECTION.rollback()
-            DB_CONNECTION.close()
+        _shutdown(commit=False)
 
         print(ERR + ' Unexpected exception:', sys.exc_info()[1])
         print(WARN + fmt_yellow(' Unsaved changes are lost!'))
         raise
 
-    DB_CURSOR.close()
-    DB_CONNECTION.commit()
-    DB_CONNECTION.close()
+    _shutdown(commit=True)
 
     print(SUCC + ' Bye..')
 